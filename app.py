@@ -1,8 +1,9 @@
 import os
+import re
+import logging
 import json
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # Interview functions
 import utils as interview
@@ -11,9 +12,16 @@ import utils as interview
 load_dotenv()
 API_KEY = os.getenv("API_KEY", "")
 MODEL = "deepseek/deepseek-r1:free"
+# Cheaper non-reasoning model for subtopic and Wikipedia query generation
+FAST_MODEL = "openai/gpt-4o-mini"
+TURNS_PER_SUBTOPIC = 2
+# Non-answers that are scored as zero without calling the grader
+_NO_ANSWER_RE = re.compile(r"^(idk|i don'?t know|n/a|no idea)[\s.!?]*$", re.IGNORECASE)
 
-print(f"[DEBUG] Model: {MODEL}")
-print(f"[DEBUG] API key loaded: {'Yes' if API_KEY else 'No'}")
+# Debug output is opt-in via LOG_LEVEL=DEBUG
+logging.basicConfig(format="[%(levelname)s] %(name)s: %(message)s")
+interview.log.debug("Model: %s (fast: %s)", MODEL, FAST_MODEL)
+interview.log.debug("API key loaded: %s", "Yes" if API_KEY else "No")
 
 st.set_page_config(page_title="AI Interviewer", page_icon="📋", layout="wide")
 st.title("AI Interviewer")
@@ -23,9 +31,10 @@ if not API_KEY:
     st.error("Missing API key. Add API_KEY to .env and refresh.")
     st.stop()
 
-# Add client and LLM model to interview module
-interview.client = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=API_KEY)
+# Add API key and LLM models to interview module (client is cached in utils.get_client)
+interview.API_KEY = API_KEY
 interview.MODEL = MODEL
+interview.FAST_MODEL = FAST_MODEL
 
 # ------ Sidebar -----
 st.sidebar.header("Interview Settings")
@@ -79,6 +88,7 @@ def init_state():
     st.session_state.style = ""
     st.session_state.awaiting_answer = False
     st.session_state.finished = False
+    st.session_state.prefetch = None
 
 
 if "topic" not in st.session_state:
@@ -130,41 +140,81 @@ else:
 
     # Current subtopic
     sub = subtopics[st.session_state.sub_idx]
+    next_sub = (
+        subtopics[st.session_state.sub_idx + 1]
+        if st.session_state.sub_idx + 1 < len(subtopics)
+        else ""
+    )
 
     st.subheader(f"Subtopic {st.session_state.sub_idx + 1} of {len(subtopics)}: {sub}")
 
+    st.markdown("#### Question")
     # If no current question, generate one
     if not st.session_state.question or not st.session_state.awaiting_answer:
         try:
             prev_q = (
-                st.session_state.history_sub[-1]["question"]
+                st.session_state.history_sub[-1].question
                 if st.session_state.history_sub
                 else ""
             )
             prev_a = (
-                st.session_state.history_sub[-1]["answer"]
+                st.session_state.history_sub[-1].answer
                 if st.session_state.history_sub
                 else ""
             )
-            q, style = interview.ask_question(
-                topic, sub, st.session_state.last_scores, prev_q, prev_a
-            )
+            # Use the question prefetched during the previous turn if it matches
+            with st.spinner("Loading question..."):
+                prefetched = interview.take_prefetched(
+                    st.session_state.prefetch,
+                    topic,
+                    sub,
+                    st.session_state.last_scores,
+                    prev_q,
+                    prev_a,
+                )
+            # Drop the prefetch once used, or if it's not the next subtopic's seed.
+            # A non-advancing turn keeps it for when the subtopic is finished.
+            if prefetched or not (
+                next_sub
+                and interview.prefetch_targets(
+                    st.session_state.prefetch, topic, next_sub
+                )
+            ):
+                st.session_state.prefetch = None
+            if prefetched:
+                q, style = prefetched
+                st.write(q)
+            else:
+                prompt, style = interview.question_prompt(
+                    topic, sub, st.session_state.last_scores, prev_q, prev_a
+                )
+                # Stream the question as it is generated, then show the cleaned text
+                question_box = st.empty()
+                raw = question_box.write_stream(
+                    interview.ask_llm_stream(prompt, temperature=0.2, cache=False)
+                )
+                q = interview.clean_question(raw)
+                question_box.write(q)
         except Exception as e:
             st.error(f"Failed to generate question: {e}")
             st.stop()
         st.session_state.question = q
         st.session_state.style = style
         st.session_state.awaiting_answer = True
+    else:
+        # Show current question
+        st.write(st.session_state.question)
+
+    # If the next answer ends this subtopic, the next question is the following
+    # subtopic's seed question, which doesn't depend on the answer, so fetch it
+    # in the background while the candidate is typing
+    if (
+        st.session_state.turns_in_sub + 1 >= TURNS_PER_SUBTOPIC
+        and next_sub
+        and not st.session_state.prefetch
+    ):
+        st.session_state.prefetch = interview.prefetch_question(topic, next_sub)
 
-    # Build Wikipedia context
-    try:
-        context = interview.build_wiki_context(topic, st.session_state.question)
-    except Exception as e:
-        context = ""
-
-    # Show current question
-    st.markdown("#### Question")
-    st.write(st.session_state.question)
     # Answer Input
     with st.form("answer_form", clear_on_submit=True):
         answer = st.text_area(
@@ -175,69 +225,39 @@ else:
     if submitted:
         st.session_state.turns_in_sub += 1
         with st.spinner("Processing your answer..."):
-            if not answer.strip():
-                # Empty answer then record zeros, stay on subtopic
+            if not answer.strip() or _NO_ANSWER_RE.match(answer.strip()):
+                # Empty or non-answer then record zeros, stay on subtopic
                 scores = {"correctness": 0, "specificity": 0}
-                entry = {
-                    "subtopic": sub,
-                    "style": st.session_state.style,
-                    "question": st.session_state.question,
-                    "answer": "",
-                    "scores": scores,
-                    "evidence": {"verdict": "insufficient", "reason": "no answer"},
-                }
+                entry = interview.TurnEntry(
+                    subtopic=sub,
+                    style=st.session_state.style,
+                    question=st.session_state.question,
+                    answer=answer.strip(),
+                    correctness=0,
+                    specificity=0,
+                    verdict="insufficient",
+                    reason="no answer",
+                )
                 st.session_state.history_sub.append(entry)
                 st.session_state.full_history.append(entry)
                 st.session_state.last_scores = scores
                 st.session_state.awaiting_answer = False
                 st.rerun()
 
-            # Ask LLM to grade the answer
-            grading_prompt = f"""
-            You are grading an interview answer.
-
-            Provide ONLY a JSON object:
-            {{"correctness": <0-3>, "specificity": <0-3>, "evidence": {{"verdict": "supported" | "contradicted" | "insufficient", "reason": "short sentence"}}}}
-
-            Scoring criteria:
-            - correctness:
-            0 = wrong/irrelevant
-            1 = mostly wrong or missing key points
-            2 = mostly correct but incomplete or vague
-            3 = fully correct, complete, and precise
-            - specificity:
-            0 = vague/general
-            1 = somewhat specific, lacks detail
-            2 = specific but not thorough
-            3 = highly precise with clear details/examples
-
-            Rules:
-            - Use CONTEXT to inform correctness:
-            - If CONTEXT explicitly refutes a claim in the ANSWER, verdict="contradicted" and correctness <= 1.
-            - If CONTEXT supports key claims, verdict="supported" and correctness >= 2 (unless other major errors).
-            - If CONTEXT is unrelated/insufficient, verdict="insufficient". Do NOT penalise correctness for irrelevance, judge correctness from general knowledge.
-
-            Topic: {topic}
-            Question: {st.session_state.question}
-            Context: {context if context else "[no context found]"}
-            Answer: {answer}
-            """
-            try:
-                raw = interview.ask_llm(grading_prompt, temperature=0.0)
-                result = interview.clean_json(raw)
-            except Exception:
-                result = {
-                    "correctness": 0,
-                    "specificity": 0,
-                    "evidence": {
-                        "verdict": "insufficient",
-                        "reason": "Could not parse JSON",
-                    },
-                }
+            # Checkpoints verify basic facts, and short answers rarely need context
+            need_context = (
+                st.session_state.style != "checkpoint" and len(answer.split()) >= 8
+            )
+            # Build Wikipedia context (if needed) and ask LLM to grade the answer
+            result = interview.grade_and_context(
+                topic, st.session_state.question, answer, need_context
+            )
 
             # Show scores
             c, s = int(result.get("correctness", 0)), int(result.get("specificity", 0))
             ev = result.get("evidence", {})
+            if not isinstance(ev, dict):
+                ev = {}
             col1, col2 = st.columns(2)
             col1.metric("Correctness (0-3)", c)
             col2.metric("Specificity (0-3)", s)
@@ -245,14 +265,16 @@ else:
                 st.caption(f"Evidence: {ev.get('verdict')} - {ev.get('reason')}")
 
             # Record answer in session history
-            entry = {
-                "subtopic": sub,
-                "style": st.session_state.style,
-                "question": st.session_state.question,
-                "answer": answer,
-                "scores": result,
-                "evidence": ev,
-            }
+            entry = interview.TurnEntry(
+                subtopic=sub,
+                style=st.session_state.style,
+                question=st.session_state.question,
+                answer=answer,
+                correctness=c,
+                specificity=s,
+                verdict=ev.get("verdict", ""),
+                reason=ev.get("reason", ""),
+            )
             st.session_state.history_sub.append(entry)
             st.session_state.full_history.append(entry)
             st.session_state.last_scores = result
@@ -262,7 +284,7 @@ else:
             moved = False
             last_subtopic = st.session_state.sub_idx >= len(subtopics) - 1
 
-            if st.session_state.turns_in_sub >= 2:
+            if st.session_state.turns_in_sub >= TURNS_PER_SUBTOPIC:
                 info_statement = "Subtopic turn limit reached."
                 if not last_subtopic:
                     info_statement += " Advancing to next subtopic."
@@ -271,17 +293,16 @@ else:
 
             if moved:
                 # Flag poor areas for this subtopic
-                if interview.still_poor_after_checkpoint(
+                poor_ckpt, poor_probe = interview.poor_flags(
                     st.session_state.history_sub
-                ) or interview.still_poor_after_probe(st.session_state.history_sub):
+                )
+                if poor_ckpt or poor_probe:
                     reasons = []
-                    if interview.still_poor_after_checkpoint(
-                        st.session_state.history_sub
-                    ):
+                    if poor_ckpt:
                         reasons.append(
                             "correctness stayed < 2 after a checkpoint question"
                         )
-                    if interview.still_poor_after_probe(st.session_state.history_sub):
+                    if poor_probe:
                         reasons.append("specificity stayed < 2 after a probe question")
                     st.session_state.poor_areas.append(
                         {
@@ -303,21 +324,44 @@ else:
 
             st.rerun()
 
+
 # ------- Final report --------
+@st.cache_data(max_entries=64, show_spinner=False)
+def _render_history(history_tuple: tuple) -> str:
+    """Build the interview record as one markdown string.
+    Takes (question, answer, correctness, specificity, verdict, reason) tuples
+    so the result is cached until the history changes."""
+    blocks = []
+    for i, (q, a, c, s, verdict, reason) in enumerate(history_tuple, 1):
+        block = (
+            f"**Q{i}: {q}**\n\n"
+            f"**Answer:** {a or '(no answer)'}\n\n"
+            f"- Correctness: {c}\n"
+            f"- Specificity: {s}\n"
+        )
+        if verdict or reason:
+            block += f"\n*Evidence: {verdict} - {reason}*\n"
+        blocks.append(block)
+    return "\n---\n\n".join(blocks)
+
+
 if st.session_state.get("finished", False):
     st.header("Final report")
 
-    # Questions and answers in expanders
+    # Questions and answers rendered once as a single markdown block
     st.subheader("Interview Record")
-    for i, entry in enumerate(st.session_state.full_history, 1):
-        with st.expander(f"Q{i}: {entry['question']}"):
-            st.markdown(f"**Answer:** {entry['answer'] or '(no answer)'}")
-            s = entry.get("scores", {})
-            ev = entry.get("evidence", {})
-            st.write(f"- Correctness: {s.get('correctness', 0)}")
-            st.write(f"- Specificity: {s.get('specificity', 0)}")
-            if ev:
-                st.caption(f"Evidence: {ev.get('verdict')} - {ev.get('reason')}")
+    history_tuple = tuple(
+        (
+            entry.question,
+            entry.answer,
+            entry.correctness,
+            entry.specificity,
+            entry.verdict,
+            entry.reason,
+        )
+        for entry in st.session_state.full_history
+    )
+    st.markdown(_render_history(history_tuple))
 
     # Show subtopics where weaknesses were detected
     st.subheader("Poor areas")
@@ -329,6 +373,16 @@ if st.session_state.get("finished", False):
 
     # Summary of Strengths and Weaknesses
     full_history = st.session_state.full_history
+    # Project each record to a minimal schema to keep the prompt small
+    compact = [
+        {
+            "q": e.question,
+            "a": e.answer[:500],
+            "c": e.correctness,
+            "s": e.specificity,
+        }
+        for e in full_history
+    ]
     try:
         summary_prompt = f"""
         Return ONLY this template (plain text, no extra headings):
@@ -338,10 +392,10 @@ if st.session_state.get("finished", False):
         Weaknesses:
         - <up to 3 short bullets grounded in the records>
 
-        Records (use scores exactly as is, do not change numbers):
-        {json.dumps(full_history, indent=2)}
+        Records (q=question, a=answer, c=correctness 0-3, s=specificity 0-3; use scores exactly as is, do not change numbers):
+        {json.dumps(compact, separators=(",", ":"))}
         """
-        summary = interview.ask_llm(summary_prompt, temperature=0.2)
+        summary = interview.ask_llm(summary_prompt, temperature=0.2, cache=False)
         summary = summary.replace("Weaknesses:", "\n\nWeaknesses:")
     except Exception as e:
         summary = f"Could not generate summary: {e}"
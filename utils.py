@@ -1,89 +1,285 @@
 import os
 import json
 import re
-import wikipedia
-from wikipedia.exceptions import DisambiguationError, PageError
-from openai import OpenAI
+import logging
+import hashlib
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+import diskcache
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import streamlit as st
+from openai import OpenAI, APIConnectionError, APIStatusError
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+log = logging.getLogger("interview")
+_log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+# Unknown level names fall back to INFO instead of failing at import
+log.setLevel(
+    _log_level if isinstance(logging.getLevelName(_log_level), int) else "INFO"
+)
 
 # --------API Key and Model Placeholders-------
 API_KEY = ""
 MODEL = ""
-client = ""
+FAST_MODEL = ""  # for light structured calls, falls back to MODEL if unset
+
+# Retry transient API failures (timeouts, dropped connections, 408/409/429/5xx).
+# The SDK's own retries are disabled on the client so these are the only ones.
+LLM_TIMEOUT = 120  # seconds per request
+
+
+def is_transient_llm_error(e: BaseException) -> bool:
+    """Return True for the errors the OpenAI SDK itself would retry."""
+    if isinstance(e, APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(e, APIStatusError):
+        return e.status_code in (408, 409, 429) or e.status_code >= 500
+    return False
+
+
+llm_retry = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=1, max=10),
+    retry=retry_if_exception(is_transient_llm_error),
+    reraise=True,
+)
+
+# Persistent LLM reply cache keyed on (model, temperature, prompt)
+llm_cache = diskcache.Cache(os.path.expanduser("~/.ai_interviewer_cache"))
+CACHE_MAX_TEMPERATURE = 0.5
+LLM_CACHE_TTL = 7 * 24 * 3600
+
+JSON_ONLY_SUFFIX = (
+    "\nRespond with the JSON object ONLY. No reasoning, prose or code fences."
+)
 
 
 # ------- Utilities ---------
-def ask_llm(prompt, temperature=0.2):
-    """Send prompt to the LLM and return the text reply."""
-    print(
-        f"\n[DEBUG] Sending prompt to LLM (temperature={temperature}):\n{prompt[:300]}...\n"
+@st.cache_resource(show_spinner=False)
+def get_client(api_key: str) -> OpenAI:
+    """Return one OpenAI client per API key, reused across reruns and sessions
+    so its connection pool persists."""
+    return OpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=api_key,
+        max_retries=0,
+        timeout=LLM_TIMEOUT,
     )
-    resp = client.chat.completions.create(
-        model=MODEL,
+
+
+def llm_cache_key(
+    prompt: str, temperature: float, json_mode: bool = False, model: str = ""
+) -> str:
+    """Hash the model, temperature, response mode and prompt into a cache key."""
+    mode = "json" if json_mode else "text"
+    return hashlib.blake2b(
+        ((model or MODEL) + str(temperature) + mode + prompt).encode()
+    ).hexdigest()
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def parse_json_reply(reply: str | None) -> dict:
+    """Parse a JSON-mode reply, raising json.JSONDecodeError unless it is an object.
+    - Empty replies (e.g. a reasoning model returning None content) count as invalid
+    - If the provider ignored response_format and wrapped the object in code fences
+      or prose, decodes straight from the first '{' instead"""
+    if not reply:
+        raise json.JSONDecodeError("Empty reply", "", 0)
+    try:
+        obj = json.loads(reply)
+    except json.JSONDecodeError:
+        start = reply.find("{")
+        if start == -1:
+            raise
+        obj, _ = _JSON_DECODER.raw_decode(reply, start)
+    if not isinstance(obj, dict):
+        raise json.JSONDecodeError("Expected a JSON object", reply, 0)
+    return obj
+
+
+def response_format_kwargs(json_mode: bool) -> dict:
+    """Extra completion kwargs that force a JSON object reply when json_mode is set."""
+    return {"response_format": {"type": "json_object"}} if json_mode else {}
+
+
+@llm_retry
+def ask_llm(prompt, temperature=0.2, cache=True, json_mode=False, model=None):
+    """Send prompt to the LLM and return the text reply.
+    - json_mode requests a JSON object reply and returns it parsed (json.JSONDecodeError if invalid)
+    - model overrides MODEL (e.g. FAST_MODEL for light structured calls)
+    - Cached on disk (LLM_CACHE_TTL) unless cache=False or temperature > 0.5"""
+    model = model or MODEL
+    use_cache = cache and temperature <= CACHE_MAX_TEMPERATURE
+    key = llm_cache_key(prompt, temperature, json_mode, model)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            log.debug("LLM cache hit")
+            return parse_json_reply(cached) if json_mode else cached
+
+    log.debug("Sending prompt to LLM (temperature=%s):\n%.300s...", temperature, prompt)
+    resp = get_client(API_KEY).chat.completions.create(
+        model=model,
         messages=[{"role": "user", "content": prompt}],
         temperature=temperature,
+        **response_format_kwargs(json_mode),
     )
     reply = resp.choices[0].message.content
-    print(f"[DEBUG]LLM raw reply (first 300 chars):\n{reply[:300]}...\n")
-    return reply
+    log.debug("LLM raw reply (first 300 chars):\n%.300s...", reply)
+    # Parse before caching so an invalid JSON reply is never stored
+    result = parse_json_reply(reply) if json_mode else reply
+    if use_cache and reply:
+        llm_cache.set(key, reply, expire=LLM_CACHE_TTL)
+    return result
 
 
-def clean_json(text: str) -> dict:
-    """
-    Extract JSON object from raw LLM text and parse it. Finds the first '{' and last '}' to retrieve JSON.
-    """
-    s = text.strip()
-    start = s.find("{")
-    end = s.rfind("}")
-    if start == -1 or end == -1 or end <= start:
-        raise json.JSONDecodeError("Could not locate JSON braces", s, 0)
-    candidate = s[start : end + 1]
-    candidate = candidate.replace(",}", "}").replace(",]", "]")
-    return json.loads(candidate)
+@llm_retry
+def _create_stream(prompt, temperature):
+    """Open a streaming completion (retried, since the generator itself can't be)."""
+    return get_client(API_KEY).chat.completions.create(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        stream=True,
+    )
+
+
+def ask_llm_stream(prompt, temperature=0.2, cache=True):
+    """Send prompt to the LLM and yield the reply text as it arrives.
+    Uses the same disk cache as ask_llm, a cache hit is yielded in one chunk."""
+    use_cache = cache and temperature <= CACHE_MAX_TEMPERATURE
+    key = llm_cache_key(prompt, temperature)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            log.debug("LLM cache hit")
+            yield cached
+            return
+
+    log.debug(
+        "Streaming prompt to LLM (temperature=%s):\n%.300s...", temperature, prompt
+    )
+    parts = []
+    for chunk in _create_stream(prompt, temperature):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+    reply = "".join(parts)
+    log.debug("LLM streamed reply (first 300 chars):\n%.300s...", reply)
+    if use_cache and reply:
+        llm_cache.set(key, reply, expire=LLM_CACHE_TTL)
+
+
+_ANSWER_RE = re.compile(r"\banswer\s*:", re.IGNORECASE)
 
 
 # --------- Wikipedia Search -----------
+WIKI_API_URL = "https://en.wikipedia.org/w/api.php"
+WIKI_SUMMARY_URL = "https://en.wikipedia.org/api/rest_v1/page/summary/"
+WIKI_SEARCH_RESULTS = 3
+WIKI_SUMMARY_MAX_CHARS = 800
+
+# One keep-alive session shared by all lookups (and the worker threads in build_wiki_context)
+_SESSION = requests.Session()
+_SESSION.headers["User-Agent"] = "ai_interviewer/1.0"
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=2, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504)
+        ),
+    ),
+)
+
+
+@st.cache_data(ttl=24 * 3600, max_entries=1024, show_spinner=False)
+def _wiki_titles_cached(query: str) -> list[str]:
+    """Cached Wikipedia title search, shared across reruns and sessions."""
+    resp = _SESSION.get(
+        WIKI_API_URL,
+        params={
+            "action": "query",
+            "list": "search",
+            "srsearch": query,
+            "srlimit": WIKI_SEARCH_RESULTS,
+            "srprop": "",
+            "format": "json",
+        },
+        timeout=10,
+    )
+    resp.raise_for_status()
+    return [hit["title"] for hit in resp.json().get("query", {}).get("search", [])]
+
+
+@st.cache_data(ttl=24 * 3600, max_entries=1024, show_spinner=False)
+def _wiki_summary_cached(title: str) -> tuple[str, str]:
+    """Cached (page type, extract) from the REST summary endpoint for an exact title.
+    Missing pages return ("missing", ""). Network errors are raised, not cached."""
+    resp = _SESSION.get(
+        WIKI_SUMMARY_URL + quote(title.replace(" ", "_"), safe=""), timeout=10
+    )
+    if resp.status_code == 404:
+        return "missing", ""
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("type", ""), data.get("extract", "")
+
+
 def wiki_search(query: str) -> str:
     """Wikipedia search and return the summary of the page hits.
 
     Flow:
-    1. Search for the query and take the first result ("first page hit").
-       Example: query = "Egypt", search returns ["Egypt"], use "Egypt".
+    1. Search for the query and take the top results ("first page hit" first).
+       Example: query = "Egypt", search returns ["Egypt", ...], use "Egypt".
     2. Try to fetch the page summary.
-    3. If the query is ambiguous (DisambiguationError):
+    3. If the page is a disambiguation page:
          - Example: query = "Mercury" can mean the planet or the element.
-         - Wikipedia returns options like ["Mercury (planet)", "Mercury (element)"...].
-         - Fall back to the first suggested option (e.g. "Mercury (planet)").
-    4. If the page does not exist (PageError) or another error occurs:
+         - Fall back to the next search hit (e.g. "Mercury (planet)").
+    4. If no page exists or another error occurs:
          - Return an empty string
 
+    Calls the MediaWiki APIs directly over a pooled keep-alive session.
+    Searches and summaries are cached for 24h so repeated queries skip the HTTP call.
     """
-    print(f"[DEBUG] Searching Wikipedia for: {query}")
+    log.debug("Searching Wikipedia for: %s", query)
     try:
-        titles = wikipedia.search(query, results=1)
-        print(f"[DEBUG] Search results: {titles}")
-        if not titles:
-            return ""
-        try:
-            snippet = wikipedia.summary(titles[0], auto_suggest=False)
-            print(
-                f"[DEBUG] Retrieved full summary for: {titles[0]} (chars={len(snippet)})"
-            )
-            return snippet
-        except DisambiguationError as e:
-            if e.options:
-                print(f"[DEBUG] DisambiguationError, trying: {e.options[0]}")
-                return wikipedia.summary(e.options[0], auto_suggest=False)
-            else:
-                return ""
-        except PageError:
-            return ""
+        titles = _wiki_titles_cached(query)
+        log.debug("Search results: %s", titles)
+        for title in titles:
+            page_type, snippet = _wiki_summary_cached(title)
+            if page_type == "disambiguation":
+                log.debug("Disambiguation page: %s, trying next hit", title)
+                continue
+            if snippet:
+                log.debug(
+                    "Retrieved full summary for: %s (chars=%d)", title, len(snippet)
+                )
+                return snippet
+        return ""
     except Exception as e:
-        print(f"[DEBUG] Wikipedia search failed: {e}")
+        log.debug("Wikipedia search failed: %s", e)
         return ""
 
 
+@st.cache_data(ttl=3600, show_spinner=False)
 def suggest_wiki_queries(topic: str, question: str) -> list[str]:
-    """Ask the LLM to propose up to 2 short wikipedia search queries for a given topic and question."""
+    """Ask the LLM to propose up to 2 short wikipedia search queries for a given topic and question.
+    Cached on (topic, question) so Streamlit reruns don't repeat the LLM call."""
     prompt = f"""
     Return ONLY a single JSON object like:
     {{"queries": ["...", "..."]}}
@@ -100,10 +296,8 @@ def suggest_wiki_queries(topic: str, question: str) -> list[str]:
     Topic: {topic}
     Question: {question}
     """
-    raw = ask_llm(prompt, temperature=0.2)
-    print(f"[DEBUG] Raw wikipedis query suggestion (first 300):\n{raw[:300]}\n")
     try:
-        data = clean_json(raw)
+        data = ask_llm(prompt, temperature=0.2, json_mode=True, model=FAST_MODEL)
         queries = data.get("queries", [])
         seen, out = set(), []
         for q in queries:
@@ -114,8 +308,9 @@ def suggest_wiki_queries(topic: str, question: str) -> list[str]:
                 seen.add(q_norm)
                 out.append(q_clean)
         return out[:2]
-    except Exception as e:
-        print(f"[DEBUG] Could not parse wiki query JSON: {e}")
+    except (ValueError, AttributeError, TypeError) as e:
+        # Invalid or unexpected JSON only, API errors still propagate
+        log.debug("Could not parse wiki query JSON: %s", e)
         return []
 
 
@@ -123,10 +318,11 @@ def build_wiki_context(topic: str, question: str) -> str:
     """Build wikipedia context block.
     Flow:
     - Ask the LLM to suggest up to 2 short wikipedia search queries with suggest_wiki_queries
-    - Search each query and fetch the Wikipedia summary.
+    - Search each query concurrently and fetch the Wikipedia summary.
+    - Trim each summary to its first 2 paragraphs and WIKI_SUMMARY_MAX_CHARS.
     - Return them joined together as one context string.
     """
-    context_parts, tried = [], set()
+    queries, tried = [], set()
 
     for q in suggest_wiki_queries(topic, question):
         key = (q or "").strip().lower()
@@ -135,14 +331,26 @@ def build_wiki_context(topic: str, question: str) -> str:
             continue
         # Track seen query
         tried.add(key)
-        summary = wiki_search(q)
+        queries.append(q)
+
+    if not queries:
+        return ""
+
+    # Lookups are I/O bound so run them concurrently, map keeps query order
+    with ThreadPoolExecutor(max_workers=len(queries)) as ex:
+        summaries = list(ex.map(wiki_search, queries))
+
+    context_parts = []
+    for q, summary in zip(queries, summaries):
+        # Keep context small for the grading prompt: first 2 paragraphs, capped length
+        summary = "\n\n".join(summary.split("\n\n")[:2])[:WIKI_SUMMARY_MAX_CHARS]
         if summary:
-            print(
-                f"[DEBUG]Wikipedia hit for query: {q} (chars={len(summary)})"
+            log.debug(
+                "Wikipedia hit for query: %s (chars=%d)", q, len(summary)
             )  # Check hit and length of summary
             context_parts.append(summary)
         else:
-            print(f"[DEBUG] Wikipedia miss for query: {q}")
+            log.debug("Wikipedia miss for query: %s", q)
 
     return ("\n\n").join(context_parts).strip()
 
@@ -158,24 +366,95 @@ def get_subtopics(topic: str) -> list[str]:
 
     Topic: {topic}
     """
-    raw = ask_llm(prompt, temperature=0.2)
     try:
-        data = clean_json(raw)
+        data = ask_llm(prompt, temperature=0.2, json_mode=True, model=FAST_MODEL)
         subs = [s.strip() for s in data.get("subtopics", []) if s.strip()]
         return subs[:3] if subs else [topic]
-    except Exception:
+    except (ValueError, AttributeError, TypeError):
+        # Invalid or unexpected JSON only, API errors still propagate
         return [topic]
 
 
+# ------- Grading --------
+# Static rubric, only the topic/question/context/answer fields are appended per turn
+_GRADING_HEADER = """
+    You are grading an interview answer.
+
+    Provide ONLY a JSON object:
+    {"correctness": <0-3>, "specificity": <0-3>, "evidence": {"verdict": "supported" | "contradicted" | "insufficient", "reason": "short sentence"}}
+
+    Scoring criteria:
+    - correctness:
+    0 = wrong/irrelevant
+    1 = mostly wrong or missing key points
+    2 = mostly correct but incomplete or vague
+    3 = fully correct, complete, and precise
+    - specificity:
+    0 = vague/general
+    1 = somewhat specific, lacks detail
+    2 = specific but not thorough
+    3 = highly precise with clear details/examples
+
+    Rules:
+    - Use CONTEXT to inform correctness:
+    - If CONTEXT explicitly refutes a claim in the ANSWER, verdict="contradicted" and correctness <= 1.
+    - If CONTEXT supports key claims, verdict="supported" and correctness >= 2 (unless other major errors).
+    - If CONTEXT is unrelated/insufficient, verdict="insufficient". Do NOT penalise correctness for irrelevance, judge correctness from general knowledge.
+"""
+
+
+def grade_and_context(
+    topic: str, question: str, answer: str, need_context: bool = True
+) -> dict:
+    """Build the Wikipedia context and grade the answer against it.
+    - Skips the lookup when need_context is False, Context is then left out of the prompt
+    - Re-asks once with a JSON-only suffix if the reply can't be parsed
+    - Falls back to zero scores if it still can't be parsed or the request fails"""
+    context = ""
+    if need_context:
+        try:
+            context = build_wiki_context(topic, question)
+        except Exception:
+            context = ""
+    context_line = f"Context: {context}\n" if context else ""
+
+    grading_prompt = (
+        f"{_GRADING_HEADER}\n"
+        f"Topic: {topic}\n"
+        f"Question: {question}\n"
+        f"{context_line}"
+        f"Answer: {answer}\n"
+    )
+    try:
+        try:
+            return ask_llm(grading_prompt, temperature=0.0, json_mode=True)
+        except json.JSONDecodeError:
+            # Reply was not valid JSON (e.g. truncated), ask once more strictly
+            log.debug("Grading JSON invalid, retrying with JSON-only suffix")
+            return ask_llm(
+                grading_prompt + JSON_ONLY_SUFFIX, temperature=0.0, json_mode=True
+            )
+    except json.JSONDecodeError:
+        reason = "Could not parse JSON"
+    except Exception as e:
+        log.warning("Grading request failed: %s", e)
+        reason = "Grading request failed"
+    return {
+        "correctness": 0,
+        "specificity": 0,
+        "evidence": {"verdict": "insufficient", "reason": reason},
+    }
+
+
 # ------- Question Logic --------
-def ask_question(
+def question_prompt(
     topic: str,
     subtopic: str,
     last_scores: dict | None,
     prev_q: str = "",
     prev_a: str = "",
 ) -> tuple[str, str]:
-    """Generate the next interview question.
+    """Build the prompt for the next interview question and return (prompt, style).
     - If no scores yet: seed question
     - If low correctness: checkpoint question
     - If low specificity: probe question"""
@@ -223,29 +502,104 @@ def ask_question(
                 f"Return ONLY the question text, without answers, hints, or commentary. Question:"
             )
 
-    print(f"[DEBUG] Question style: {style} ({subtopic})")
-    q = ask_llm(prompt, temperature=0.2)
+    log.debug("Question style: %s (%s)", style, subtopic)
+    return prompt, style
+
+
+def clean_question(q: str) -> str:
+    """Strip the 'Question:' label and anything after 'Answer:' from the LLM reply."""
     q = q.replace("Question:", "").replace("QUESTION:", "").strip()
     # Remove anything after 'Answer:'
-    q = re.split(r"(?i)\banswer\s*:", q)[0].strip()
-    return q, style
+    return _ANSWER_RE.split(q, maxsplit=1)[0].strip()
 
 
-def still_poor_after_checkpoint(history: list[dict]) -> bool:
-    """Return True if a checkpoint question was asked but correctness never reached >= 2."""
-    asked = any(h["style"] == "checkpoint" for h in history)
-    max_c = max(
-        (int(h["scores"].get("correctness", 0)) for h in history if h.get("scores")),
-        default=0,
-    )
-    return asked and max_c < 2
+def ask_question(
+    topic: str,
+    subtopic: str,
+    last_scores: dict | None,
+    prev_q: str = "",
+    prev_a: str = "",
+) -> tuple[str, str]:
+    """Generate the next interview question and return (question, style)."""
+    prompt, style = question_prompt(topic, subtopic, last_scores, prev_q, prev_a)
+    # Not cached so a restart on the same topic gets fresh questions
+    q = ask_llm(prompt, temperature=0.2, cache=False)
+    return clean_question(q), style
 
 
-def still_poor_after_probe(history: list[dict]) -> bool:
-    """Return True if a probe question was asked but specificity never reached >= 2."""
-    asked = any(h["style"] == "probe" for h in history)
-    max_s = max(
-        (int(h["scores"].get("specificity", 0)) for h in history if h.get("scores")),
-        default=0,
-    )
-    return asked and max_s < 2
+# ------- Question Prefetch --------
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=4)
+PREFETCH_WAIT = 5  # seconds to wait for an in-flight prefetch before streaming
+
+
+def prefetch_question(
+    topic: str,
+    subtopic: str,
+    last_scores: dict | None = None,
+    prev_q: str = "",
+    prev_a: str = "",
+) -> dict:
+    """Start generating a question in a background thread.
+    Returns {"key": ask_question args, "future": Future of (question, style)}."""
+    log.debug("Prefetching question (%s)", subtopic)
+    key = (topic, subtopic, last_scores, prev_q, prev_a)
+    future = _PREFETCH_POOL.submit(ask_question, *key)
+    return {"key": key, "future": future}
+
+
+def prefetch_targets(prefetch: dict | None, topic: str, subtopic: str) -> bool:
+    """Return True if prefetch is for the seed question of this topic/subtopic."""
+    return bool(prefetch) and prefetch["key"] == (topic, subtopic, None, "", "")
+
+
+def take_prefetched(
+    prefetch: dict | None,
+    topic: str,
+    subtopic: str,
+    last_scores: dict | None,
+    prev_q: str = "",
+    prev_a: str = "",
+) -> tuple[str, str] | None:
+    """Return (question, style) from a prefetch made with the same arguments.
+    Waits up to PREFETCH_WAIT if it is still running.
+    Returns None if it doesn't match, failed or timed out."""
+    key = (topic, subtopic, last_scores, prev_q, prev_a)
+    if not prefetch or prefetch["key"] != key:
+        return None
+    try:
+        return prefetch["future"].result(timeout=PREFETCH_WAIT)
+    except Exception as e:
+        # Includes TimeoutError, the caller then streams a fresh question
+        log.debug("Prefetched question unavailable: %r", e)
+        return None
+
+
+# ------- Interview Records --------
+@dataclass(slots=True)
+class TurnEntry:
+    """One answered interview turn, stored in session history."""
+
+    subtopic: str
+    style: str
+    question: str
+    answer: str
+    correctness: int
+    specificity: int
+    verdict: str
+    reason: str
+
+
+def poor_flags(history: list[TurnEntry]) -> tuple[bool, bool]:
+    """Return (poor after checkpoint, poor after probe) in a single pass over history.
+    - Poor after checkpoint: a checkpoint was asked but correctness never reached >= 2
+    - Poor after probe: a probe was asked but specificity never reached >= 2"""
+    saw_ckpt = saw_probe = False
+    max_c = max_s = 0
+    for h in history:
+        if h.style == "checkpoint":
+            saw_ckpt = True
+        elif h.style == "probe":
+            saw_probe = True
+        max_c = max(max_c, h.correctness)
+        max_s = max(max_s, h.specificity)
+    return saw_ckpt and max_c < 2, saw_probe and max_s < 2